@@ -4,8 +4,24 @@ to implement specific devices
 """
 import warnings
 import time
+from contextlib import contextmanager
 from interfaces import BaseInterface, check_interface
 
+# query, device dependent, execution and command error bits of the event status register
+ESR_ERRORS = 0x3C
+
+class DeviceError(Exception):
+    """
+    raised when a device reports errors
+
+    errors is a list of (code, message) tuples read from the error queue
+    commands is the list of commands sent since the last clean error check
+    """
+    def __init__(self, errors, commands=()):
+        self.errors = list(errors)
+        self.commands = list(commands)
+        super(DeviceError, self).__init__(
+            "device errors {} after commands {}".format(self.errors, self.commands))
 
 
 class BaseDevice(BaseInterface):
@@ -29,6 +45,9 @@ class BaseDevice(BaseInterface):
 
     query_delay = 0.0
 
+    _deferred = False
+    _window = ()
+
     @property
     def timeout(self):
         """ I/O timeout """
@@ -80,6 +99,9 @@ class BaseDevice(BaseInterface):
         term = self._write_termination if termination is None else termination
         enco = self._encoding if encoding is None else encoding
 
+        if self._deferred:
+            self._window.append(message)
+
         if term:
             if message.endswith(term):
                 warnings.warn("write message already ends with termination characters")
@@ -128,6 +150,9 @@ class BaseDevice(BaseInterface):
         :rtype: str
         """
 
+        if self._deferred:
+            message += ";*ESR?"
+
         self.write(message)
 
         delay = self.query_delay if delay is None else delay
@@ -135,7 +160,79 @@ class BaseDevice(BaseInterface):
         if delay > 0.0:
             time.sleep(delay)
 
-        return self.read()
+        reply = self.read()
+        if not self._deferred:
+            return reply
+
+        reply, esr = reply.rsplit(';', 1)
+        self._check_esr(int(esr))
+        return reply
+
+    @contextmanager
+    def deferred_errors(self):
+        """
+        context in which commands are sent without error checks
+
+        the event status register is read along with every query (";*ESR?" is appended)
+        and the error queue is only drained when its error bits (or the interface's error
+        flag) are set. DeviceError is raised with the errors and the commands sent since
+        the last clean check. Errors are checked once more when the context exits.
+        Requires a device which understands IEEE 488.2 *ESR? and SCPI SYST:ERR?
+        """
+        self._deferred = True
+        self._window = []
+        if hasattr(self._interface, 'defer_errors'):
+            self._interface.defer_errors = True
+        # a flag left from polls outside the context doesn't belong to this window
+        if hasattr(self._interface, 'error_pending'):
+            self._interface.error_pending = False
+        try:
+            yield self
+        finally:
+            self._deferred = False
+            if hasattr(self._interface, 'defer_errors'):
+                self._interface.defer_errors = False
+        self._check_esr(int(self.query("*ESR?")))
+
+    def _check_esr(self, esr):
+        """
+        drains error queue if esr or interface report errors and raises DeviceError
+        if the queue held any
+        """
+        if not (esr & ESR_ERRORS or getattr(self._interface, 'error_pending', False)):
+            self._window = [] if self._deferred else ()
+            return
+
+        deferred, self._deferred = self._deferred, False
+        try:
+            errors = self.error_queue()
+        finally:
+            self._deferred = deferred
+
+        commands = self._window
+        self._window = [] if self._deferred else ()
+        if errors:
+            raise DeviceError(errors, commands)
+
+    def error_queue(self, max_errors=100):
+        """ reads the error queue until empty and returns list of (code, message) """
+        if hasattr(self._interface, 'error_pending'):
+            self._interface.error_pending = False
+        errors = []
+        for _ in range(max_errors):
+            err_code, err_msg = self.syst_err()
+            if err_code == 0:
+                break
+            errors.append((err_code, err_msg))
+        return errors
+
+    def syst_err(self):
+        """ queries system err queue and returns result """
+        err = self.query("SYST:ERR?")
+        err = err.split(',')
+        err_code = int(err[0])
+        err_msg = str(err[1]).strip('"')
+        return err_code, err_msg
 
     def idn(self):
         return self.query("*IDN?")
@@ -0,0 +1,196 @@
+"""
+finds instruments on Prologix ethernet GPIB buses
+
+discover probes every GPIB address of one or more Prologix controllers with short
+timeouts, identifies responding instruments with *IDN? (or ID? for HP analyzers) and maps
+them to driver classes. The inventory can be cached to a json file (keyed by controller
+ip) so later startups skip probing.
+"""
+from __future__ import print_function
+import re
+import json
+import os
+import threading
+
+from interfaces import SocketInterface, TempPrologixEnetInterface, InterfaceTimeoutError, \
+    check_gpib
+from specanalyzer import RandSFSP, HP8593E
+from bncinst import BNC845
+
+PROLOGIX_PORT = 1234
+# prologix secondary addresses are sent as 96 + SAD
+SAD_OFFSET = 96
+
+# (identification regex, driver class)
+DRIVERS = (
+    (r'ROHDE.*FSP', RandSFSP),
+    (r'8593E', HP8593E),
+    (r'BERKELEY.*845|\b845\b', BNC845),
+)
+
+
+def driver_for(idn):
+    """ returns driver class for identification string or None if unknown """
+    for pattern, driver in DRIVERS:
+        if re.search(pattern, idn, re.IGNORECASE):
+            return driver
+    return None
+
+
+def _addr_args(gpib_addr):
+    """ returns prologix address arguments for PAD or (PAD, SAD) """
+    if isinstance(gpib_addr, tuple):
+        pad, sad = gpib_addr
+        return "{0:d} {1:d}".format(pad, sad + SAD_OFFSET)
+    return "{0:d}".format(gpib_addr)
+
+
+def _sort_key(gpib_addr):
+    """ sorts PAD before its (PAD, SAD) pairs """
+    return gpib_addr if isinstance(gpib_addr, tuple) else (gpib_addr, -1)
+
+
+def _read_line(interface):
+    """ reads from interface until newline, returns stripped string """
+    reply = bytes()
+    while not reply.endswith(b'\n'):
+        chunk = interface.read_raw()
+        if not chunk:
+            break
+        reply += chunk
+    return reply.decode('ascii', 'replace').strip()
+
+
+def _query(interface, message):
+    """ writes message and returns reply line or None on timeout """
+    interface.write_raw(message.encode('ascii'))
+    try:
+        return _read_line(interface) or None
+    except InterfaceTimeoutError:
+        return None
+
+
+def probe(interface, gpib_addr):
+    """
+    returns identification string of instrument at gpib_addr or None if nothing answers
+
+    the serial poll and each identification query are sent as a single write. ID? is only
+    tried when *IDN? gets no answer. If that fails too *CLS is sent so a SCPI instrument
+    isn't left with an undefined header error from the probe.
+    """
+    addr = _addr_args(check_gpib(gpib_addr))
+    if _query(interface, "++spoll {}\n".format(addr)) is None:
+        return None
+    for idn_query in ("*IDN?", "ID?"):
+        idn = _query(interface, "++addr {0}\n{1}\n++read eoi\n".format(addr, idn_query))
+        if idn is not None:
+            return idn
+    interface.write_raw("++addr {0}\n*CLS\n".format(addr).encode('ascii'))
+    return "UNKNOWN"
+
+
+def scan(ip, secondary=False, timeout=100):
+    """
+    returns {gpib_addr: identification} of instruments on the Prologix controller at ip
+
+    timeout (ms) is used for every probe. If secondary, every (PAD, SAD) pair is probed
+    as well which takes much longer.
+    """
+    addresses = list(range(31))
+    if secondary:
+        addresses += [(pad, sad) for pad in range(31) for sad in range(31)]
+
+    interface = SocketInterface((ip, PROLOGIX_PORT), timeout=timeout)
+    try:
+        read_tmo = max(1, min(3000, int(timeout) - 10))
+        interface.write_raw("++mode 1\n++auto 0\n++read_tmo_ms {:d}\n".format(read_tmo)
+                            .encode('ascii'))
+        found = {}
+        for gpib_addr in addresses:
+            idn = probe(interface, gpib_addr)
+            if idn is not None:
+                found[gpib_addr] = idn
+        interface.write_raw(b"++read_tmo_ms 500\n")
+    finally:
+        interface.close()
+    return found
+
+
+def discover(ips, cache_file=None, refresh=False, secondary=False, timeout=100):
+    """
+    returns inventory of instruments on the Prologix controllers at ips
+
+    controllers are scanned in parallel. The inventory is a list of dicts with 'ip',
+    'gpib_addr', 'idn' and 'driver' (class name or None). Controllers found in cache_file
+    are not probed unless refresh, the others are scanned and added to it.
+    """
+    if isinstance(ips, str):
+        ips = [ips]
+    cached = {}
+    if cache_file is not None and os.path.exists(cache_file):
+        cached = _load_cache(cache_file)
+    scan_ips = [ip for ip in ips if refresh or ip not in cached]
+    scans = {}
+
+    def run(ip):
+        """ scans one controller """
+        scans[ip] = scan(ip, secondary, timeout)
+
+    threads = [threading.Thread(target=run, args=(ip,)) for ip in scan_ips]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for ip in scan_ips:
+        if ip not in scans:
+            raise IOError("scanning Prologix controller at {} failed".format(ip))
+        cached[ip] = []
+        for gpib_addr in sorted(scans[ip], key=_sort_key):
+            idn = scans[ip][gpib_addr]
+            driver = driver_for(idn)
+            cached[ip].append({'ip': ip,
+                               'gpib_addr': gpib_addr,
+                               'idn': idn,
+                               'driver': driver.__name__ if driver is not None else None})
+
+    if cache_file is not None and scan_ips:
+        with open(cache_file, 'w') as cache:
+            json.dump(cached, cache, indent=2)
+    return [entry for ip in ips for entry in cached[ip]]
+
+
+def _load_cache(cache_file):
+    """ returns {ip: inventory entries} saved by discover """
+    with open(cache_file) as cache:
+        cached = json.load(cache)
+    for entries in cached.values():
+        for entry in entries:
+            if isinstance(entry['gpib_addr'], list):
+                entry['gpib_addr'] = tuple(entry['gpib_addr'])
+    return cached
+
+
+def load_inventory(cache_file, ips=None):
+    """ returns inventory saved by discover, only for controllers at ips if given """
+    cached = _load_cache(cache_file)
+    if ips is None:
+        ips = sorted(cached)
+    elif isinstance(ips, str):
+        ips = [ips]
+    return [entry for ip in ips for entry in cached.get(ip, [])]
+
+
+def open_instrument(entry, timeout=10000):
+    """
+    returns driver object for an inventory entry
+    (PAD, SAD) entries can't be opened since TempPrologixEnetInterface only takes a PAD
+    """
+    drivers = dict((driver.__name__, driver) for _, driver in DRIVERS)
+    if entry['driver'] not in drivers:
+        raise ValueError("no driver for {}".format(entry['idn']))
+    if isinstance(entry['gpib_addr'], tuple):
+        raise ValueError("secondary address {} not supported".format(entry['gpib_addr']))
+    interface = TempPrologixEnetInterface(entry['gpib_addr'], (entry['ip'], PROLOGIX_PORT),
+                                          timeout=timeout)
+    return drivers[entry['driver']](interface)
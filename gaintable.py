@@ -0,0 +1,167 @@
+"""
+contains GainTable which maps (frequency, raw power) to gain for signal generators
+
+Gain tables are stored in a compact binary file which is memory mapped read only so
+large tables can be shared between processes without parsing text. File layout:
+
+    8 bytes   magic b'LBLGAIN1'
+    uint32    number of frequencies (little endian)
+    uint32    number of raw powers (little endian)
+    float64   frequencies (Hz), increasing
+    float64   raw powers (dBm), increasing
+    float64   gains (dB), frequencies x raw powers, row major
+"""
+import numpy as np
+
+MAGIC = b'LBLGAIN1'
+_HEADER = np.dtype([('magic', 'S8'), ('nfreq', '<u4'), ('npow', '<u4')])
+
+
+def _weights(axis, values):
+    """
+    returns (lower index, fraction to upper index) of values on increasing axis
+    raises ValueError if any value is outside of axis
+    """
+    if axis.size == 1:
+        zeros = np.zeros(values.shape, dtype=int)
+        return zeros, zeros.astype(float)
+    if np.any(values < axis[0]) or np.any(values > axis[-1]):
+        raise ValueError("value outside of gain table range [{0}, {1}]".format(axis[0], axis[-1]))
+    lower = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, axis.size - 2)
+    frac = (values - axis[lower]) / (axis[lower + 1] - axis[lower])
+    return lower, frac
+
+
+class GainTable(object):
+    """
+    frequency x raw power gain table with vectorized bilinear interpolation
+
+    A table with a single frequency is frequency independent (the frequency is ignored).
+
+    Parameters
+    ----------
+    frequencies : array_like
+        increasing frequencies (Hz) of the table rows
+
+    raws : array_like
+        increasing raw (panel) powers (dBm) of the table columns
+
+    gains : array_like
+        gains (dB) with shape (len(frequencies), len(raws))
+    """
+    def __init__(self, frequencies, raws, gains):
+        self.frequencies = np.asarray(frequencies, dtype=float)
+        self.raws = np.asarray(raws, dtype=float)
+        self.gains = np.asarray(gains, dtype=float).reshape(self.frequencies.size, self.raws.size)
+        for name, axis in (('frequencies', self.frequencies), ('raw powers', self.raws)):
+            if np.any(np.diff(axis) <= 0):
+                raise ValueError("gain table {} must be strictly increasing".format(name))
+
+    @property
+    def frequency_dependent(self):
+        """ true if table has more than one frequency """
+        return self.frequencies.size > 1
+
+    @property
+    def min_real(self):
+        """ lowest real power reachable at every frequency """
+        return float(np.max(self.raws[0] + self.gains[:, 0]))
+
+    @property
+    def max_real(self):
+        """ highest real power reachable at every frequency """
+        return float(np.min(self.raws[-1] + self.gains[:, -1]))
+
+    @classmethod
+    def load(cls, filename):
+        """ loads binary gain table (memory mapped) or text gain file """
+        with open(filename, 'rb') as gainfile:
+            magic = gainfile.read(len(MAGIC))
+        if magic != MAGIC:
+            return cls.from_text(filename)
+
+        header = np.fromfile(filename, dtype=_HEADER, count=1)[0]
+        nfreq, npow = int(header['nfreq']), int(header['npow'])
+        data = np.memmap(filename, dtype='<f8', mode='r', offset=_HEADER.itemsize,
+                         shape=(nfreq + npow + nfreq * npow,))
+        return cls(data[:nfreq], data[nfreq:nfreq + npow], data[nfreq + npow:])
+
+    @classmethod
+    def from_text(cls, text_files, frequencies=None):
+        """
+        returns GainTable from text gain files ('raw gain [std]' lines as written by profile)
+
+        text_files is a single filename (frequency independent table) or a list of filenames
+        measured at frequencies. Every file must use the same raw powers.
+        """
+        if isinstance(text_files, str):
+            text_files = [text_files]
+            frequencies = [0.0] if frequencies is None else frequencies
+        if frequencies is None or len(frequencies) != len(text_files):
+            raise ValueError("need one frequency per text gain file")
+
+        order = np.argsort(frequencies)
+        raws = None
+        gains = []
+        for i in order:
+            file_raws, file_gains = np.loadtxt(text_files[i], unpack=True, usecols=[0, 1], ndmin=2)
+            # profile writes rows in sweep order, which may be descending
+            rows = np.argsort(file_raws)
+            file_raws, file_gains = file_raws[rows], file_gains[rows]
+            if raws is None:
+                raws = file_raws
+            elif not np.allclose(raws, file_raws):
+                raise ValueError("{} uses different raw powers".format(text_files[i]))
+            gains.append(file_gains)
+        return cls(np.asarray(frequencies, dtype=float)[order], raws, gains)
+
+    def save(self, filename):
+        """ writes table in binary gain table format """
+        header = np.array([(MAGIC, self.frequencies.size, self.raws.size)], dtype=_HEADER)
+        with open(filename, 'wb') as gainfile:
+            header.tofile(gainfile)
+            for array in (self.frequencies, self.raws, self.gains):
+                np.ascontiguousarray(array, dtype='<f8').tofile(gainfile)
+
+    def _rows(self, frequency, shape):
+        """ returns gain rows interpolated to frequency, shape (size of shape, number of raws) """
+        freqs = np.broadcast_to(np.asarray(0.0 if frequency is None else frequency, dtype=float),
+                                shape).ravel()
+        if not self.frequency_dependent:
+            return np.broadcast_to(self.gains[0], (freqs.size, self.raws.size))
+        lower, frac = _weights(self.frequencies, freqs)
+        frac = frac[:, np.newaxis]
+        return (1 - frac) * self.gains[lower] + frac * self.gains[lower + 1]
+
+    def raw_to_real(self, raw_power, frequency=None):
+        """ returns real power(s) from raw power(s) at frequency (Hz) """
+        raw = np.asarray(raw_power, dtype=float)
+        shape = np.broadcast(raw, np.asarray(frequency if frequency is not None else 0.0)).shape
+        raws = np.broadcast_to(raw, shape).ravel()
+        rows = self._rows(frequency, shape)
+        lower, frac = _weights(self.raws, raws)
+        index = np.arange(raws.size)
+        gains = (1 - frac) * rows[index, lower] + frac * rows[index, lower + 1]
+        return (raws + gains).reshape(shape)
+
+    def real_to_raw(self, real_power, frequency=None):
+        """ returns raw power(s) from real power(s) at frequency (Hz) """
+        real = np.asarray(real_power, dtype=float)
+        shape = np.broadcast(real, np.asarray(frequency if frequency is not None else 0.0)).shape
+        reals = np.broadcast_to(real, shape).ravel()
+        curves = self.raws + self._rows(frequency, shape)
+        if np.any(reals < curves[:, 0]) or np.any(reals > curves[:, -1]):
+            raise ValueError("real power outside of gain table range")
+        lower = np.clip((curves < reals[:, np.newaxis]).sum(axis=1) - 1, 0, self.raws.size - 2)
+        index = np.arange(reals.size)
+        low, high = curves[index, lower], curves[index, lower + 1]
+        frac = (reals - low) / (high - low)
+        raws = (1 - frac) * self.raws[lower] + frac * self.raws[lower + 1]
+        return raws.reshape(shape)
+
+
+def convert_text(text_files, filename, frequencies=None):
+    """ converts text gain file(s) to a binary gain table file, returns the GainTable """
+    table = GainTable.from_text(text_files, frequencies)
+    table.save(filename)
+    return table
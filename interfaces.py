@@ -89,6 +89,10 @@ class SocketInterface(BaseInterface):
 
         return ret
 
+    def close(self):
+        """ closes the socket """
+        self._sock.close()
+
     @property
     def timeout(self):
         """ returns socket timeout in ms"""
@@ -100,6 +104,111 @@ class SocketInterface(BaseInterface):
         self._sock.settimeout(value / 1000.0)
 
 
+SCPI_PORT = 5025
+
+class ScpiSocketInterface(SocketInterface):
+    """
+    Interface to talk SCPI directly over a raw LAN socket (port 5025 on the FSP,
+    the BNC845 listens on port 18) without a GPIB bridge
+
+    read_raw returns one complete message: everything up to the read termination,
+    skipping over IEEE 488.2 definite length binary blocks (#<n><length><data>, at the
+    start of a message or after ',' or ';') so terminators inside binary data don't end
+    the message early
+    """
+    read_termination = '\n'
+    write_termination = '\n'
+
+    def __init__(self, ip, port=SCPI_PORT, timeout=10000, source_address=None):
+        super(ScpiSocketInterface, self).__init__((ip, port), timeout=timeout,
+                                                  source_address=source_address)
+        self._buffer = bytearray()
+
+    def write_raw(self, message):
+        try:
+            self._sock.sendall(message)
+        except socket.timeout as err:
+            raise InterfaceTimeoutError(err)
+
+        return len(message)
+
+    def read_raw(self, size=None):
+        """ returns next complete message, or exactly size bytes if size is given """
+        if size is not None:
+            while len(self._buffer) < size:
+                self._fill(size - len(self._buffer))
+            return self._take(size)
+
+        term = (self.read_termination or '\n').encode('ascii')
+        pos = 0
+        while True:
+            end, pos, needed = self._message_end(term, pos)
+            if end is not None:
+                return self._take(end)
+            self._fill(needed)
+
+    def wait_complete(self):
+        """ waits for pending operations to complete using *OPC? """
+        self.write_raw(b"*OPC?" + self.write_termination.encode('ascii'))
+        reply = self.read_raw()
+        if int(reply) != 1:
+            raise IOError("unexpected *OPC? reply {!r}".format(reply))
+
+    def _message_end(self, term, pos):
+        """
+        returns (end, pos, needed): end is the index after the first complete message or
+        None, pos is where scanning can resume and needed is the number of bytes to wait for
+        """
+        buf = self._buffer
+        while True:
+            term_at = buf.find(term, pos)
+            block_at = buf.find(b'#', pos, term_at if term_at >= 0 else len(buf))
+            if block_at < 0:
+                if term_at >= 0:
+                    return term_at + len(term), pos, 0
+                return None, max(pos, len(buf) - len(term) + 1), self.chunk_size
+
+            # binary blocks only start a data element, '#' elsewhere is plain text
+            if block_at > 0 and buf[block_at - 1:block_at] not in (b',', b';'):
+                pos = block_at + 1
+                continue
+
+            # binary block header #<n><length>, n == 0 is an indefinite block ended by term
+            if len(buf) < block_at + 2:
+                return None, pos, self.chunk_size
+            digits = buf[block_at + 1:block_at + 2]
+            if not digits.isdigit():
+                pos = block_at + 1
+                continue
+            digits = int(digits)
+            if digits == 0:
+                pos = block_at + 2
+                continue
+            header_end = block_at + 2 + digits
+            if len(buf) < header_end:
+                return None, pos, self.chunk_size
+            block_end = header_end + int(buf[block_at + 2:header_end])
+            if len(buf) < block_end:
+                return None, pos, block_end - len(buf)
+            pos = block_end
+
+    def _fill(self, size):
+        """ receives at least one byte (up to max(size, chunk_size)) into the buffer """
+        try:
+            chunk = self._sock.recv(max(size, self.chunk_size))
+        except socket.timeout as err:
+            raise InterfaceTimeoutError(err)
+        if not chunk:
+            raise IOError("connection closed by instrument")
+        self._buffer += chunk
+
+    def _take(self, size):
+        """ removes and returns size bytes from the buffer """
+        message = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return message
+
+
 class PrologixEnetController(SocketInterface):
     """ used to control multiple devices on a Prologix Ethernet controller """
     _PORT = 1234
@@ -163,7 +272,15 @@ class PrologixEnetInterface(BaseInterface):
 MAV = 0x10
 ERR = 0x4
 class TempPrologixEnetInterface(SocketInterface):
-    """ works for only one device at a time """
+    """
+    works for only one device at a time
+
+    error_pending is set when a serial poll sees the ERR bit. A warning is issued as well
+    unless defer_errors is set (by BaseDevice.deferred_errors) to leave it to the device
+    """
+    error_pending = False
+    defer_errors = False
+
     def __init__(self, gpib_addr, addr, timeout=10000, source_address=None):
         check_gpib(gpib_addr)
         super(TempPrologixEnetInterface, self).__init__(addr, 1000, source_address)
@@ -202,7 +319,9 @@ class TempPrologixEnetInterface(SocketInterface):
         stb = int(self._read_raw().rstrip('\r\n'))
         
         if (stb & ERR) == ERR:
-            warnings.warn("Device has error bit set")
+            self.error_pending = True
+            if not self.defer_errors:
+                warnings.warn("Device has error bit set")
         return stb
 
     # def __del__(self):
@@ -0,0 +1,151 @@
+"""
+contains a streaming, crash-safe results writer for sweeps and profiles
+
+Results are stored in a directory with one append-only binary file per column and a
+schema.json recording the column dtypes, instrument settings and creation time:
+
+    results/
+        schema.json
+        timestamp.bin
+        <field>.bin
+        ...
+
+Rows are buffered in NumPy arrays and appended a chunk at a time, so a crash loses at most
+one chunk. read_results memory maps the columns so large runs aren't loaded into memory.
+"""
+import os
+import json
+from time import time
+import numpy as np
+
+SCHEMA = 'schema.json'
+
+
+def _column_file(path, name):
+    """ returns file name of column name """
+    return os.path.join(path, name + '.bin')
+
+
+def _complete_rows(path, fields):
+    """ returns number of rows written completely to every column """
+    sizes = [os.path.getsize(_column_file(path, name))
+             if os.path.exists(_column_file(path, name)) else 0 for name, _ in fields]
+    return min(size // dtype.itemsize for size, (_, dtype) in zip(sizes, fields))
+
+
+class ResultsWriter(object):
+    """
+    append-only chunked columnar results writer
+
+    Parameters
+    ----------
+    path : str
+        directory to write results to. If it already holds results with the same fields
+        they are appended to (e.g. to resume an interrupted run)
+
+    fields : list of (name, dtype)
+        columns to write. A 'timestamp' column (s since epoch) is always added
+
+    settings : dict, optional
+        instrument settings to record in the schema (must be json serializable)
+
+    chunk_size : int, optional
+        number of rows buffered before they are written
+
+    fsync_interval : float, optional
+        minimum time (s) between forcing written chunks to disk
+    """
+    def __init__(self, path, fields, settings=None, chunk_size=256, fsync_interval=5.0):
+        self.path = path
+        self.fields = [('timestamp', np.dtype('<f8'))]
+        self.fields += [(name, np.dtype(dtype)) for name, dtype in fields]
+        self.chunk_size = chunk_size
+        self.fsync_interval = fsync_interval
+
+        schema = {'fields': [[name, dtype.str] for name, dtype in self.fields],
+                  'settings': settings if settings is not None else {},
+                  'created': time()}
+        schema_file = os.path.join(path, SCHEMA)
+        if os.path.exists(schema_file):
+            with open(schema_file) as old:
+                if json.load(old)['fields'] != schema['fields']:
+                    raise ValueError("{} holds results with different fields".format(path))
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            with open(schema_file + '.tmp', 'w') as new:
+                json.dump(schema, new, indent=2, default=str)
+            os.rename(schema_file + '.tmp', schema_file)
+
+        # cut columns back to their common complete rows (a crash can cut a chunk short)
+        rows = _complete_rows(path, self.fields)
+        self._files = []
+        for name, dtype in self.fields:
+            column = open(_column_file(path, name), 'ab')
+            column.truncate(rows * dtype.itemsize)
+            self._files.append(column)
+        self._buffers = [np.empty(chunk_size, dtype=dtype) for _, dtype in self.fields]
+        self._count = 0
+        self._synced = time()
+
+    def append(self, **values):
+        """ appends a row, every field except timestamp must be given """
+        if not self._files:
+            raise ValueError("results writer is closed")
+        row = self._count
+        self._buffers[0][row] = values.pop('timestamp', time())
+        for (name, _), buf in zip(self.fields[1:], self._buffers[1:]):
+            buf[row] = values[name]
+        self._count += 1
+        if self._count == self.chunk_size:
+            self.flush()
+
+    def flush(self, fsync=False):
+        """ writes buffered rows, fsyncs if fsync or fsync_interval has passed """
+        if not self._files:
+            raise ValueError("results writer is closed")
+        for buf, column in zip(self._buffers, self._files):
+            column.write(buf[:self._count].tobytes())
+            column.flush()
+        self._count = 0
+        if fsync or time() - self._synced >= self.fsync_interval:
+            for column in self._files:
+                os.fsync(column.fileno())
+            self._synced = time()
+
+    def close(self):
+        """ writes remaining rows to disk and closes column files """
+        if not self._files:
+            return
+        self.flush(fsync=True)
+        for column in self._files:
+            column.close()
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_results(path):
+    """
+    returns (schema, columns) of results written by ResultsWriter
+
+    columns is a dict of read only memory mapped arrays, truncated to the rows
+    complete in every column
+    """
+    with open(os.path.join(path, SCHEMA)) as schema_file:
+        schema = json.load(schema_file)
+    fields = [(name, np.dtype(dtype)) for name, dtype in schema['fields']]
+    rows = _complete_rows(path, fields)
+
+    columns = {}
+    for name, dtype in fields:
+        if rows == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(_column_file(path, name), dtype=dtype, mode='r',
+                                      shape=(rows,))
+    return schema, columns
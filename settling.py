@@ -0,0 +1,241 @@
+""" contains classes to model and order around instrument settling time """
+from time import sleep, time
+import numpy as np
+from scipy.optimize import nnls
+
+
+def _as_point(point):
+    """ returns (frequency, power) for a power or a (frequency, power) pair """
+    if isinstance(point, (tuple, list)):
+        freq, power = point
+        return freq, power
+    return None, point
+
+
+def _crossings(start, end, breakpoints):
+    """ returns number of breakpoints between start and end """
+    low, high = min(start, end), max(start, end)
+    return sum(1 for point in breakpoints if low < point <= high)
+
+
+class SettlingModel(object):
+    """
+    Linear model of the time (s) an instrument setup takes to settle when moving from one
+    sweep point to another. Points are either powers (dBm) or (frequency (Hz), power) pairs.
+
+    The expected settling time is
+        base + per_db * |dP| + per_mhz * |dF| + range_change * (attenuator ranges crossed)
+             + ref_change * (reference levels crossed)
+
+    Coefficients can be learned from measured settling times with record and fit.
+
+    Parameters
+    ----------
+    power_breakpoints : iterable, optional
+        powers (dBm) at which the signal generator switches attenuator range
+
+    ref_breakpoints : iterable, optional
+        powers (dBm) at which the spectrum analyzer changes reference level
+
+    prior_weight : float, optional
+        how strongly fit keeps coefficients near their previous values
+    """
+    def __init__(self, base=0.05, per_db=0.01, per_mhz=0.001, range_change=0.5, ref_change=0.2,
+                 power_breakpoints=(), ref_breakpoints=(), prior_weight=1.0):
+        self.coefficients = np.array([base, per_db, per_mhz, range_change, ref_change], dtype=float)
+        self.prior_weight = prior_weight
+        self.power_breakpoints = tuple(power_breakpoints)
+        self.ref_breakpoints = tuple(ref_breakpoints)
+        self._features = []
+        self._timings = []
+
+    def features(self, start, end):
+        """ returns feature vector for a move from start to end """
+        start_freq, start_power = _as_point(start)
+        end_freq, end_power = _as_point(end)
+        if start_freq is None or end_freq is None:
+            freq_step = 0.0
+        else:
+            freq_step = abs(end_freq - start_freq) / 1E6
+        return np.array([1.0,
+                         abs(end_power - start_power),
+                         freq_step,
+                         _crossings(start_power, end_power, self.power_breakpoints),
+                         _crossings(start_power, end_power, self.ref_breakpoints)])
+
+    def cost(self, start, end):
+        """ returns expected settling time (s) for a move from start to end """
+        return float(np.dot(self.coefficients, self.features(start, end)))
+
+    def record(self, start, end, seconds):
+        """ records a measured settling time for a move from start to end """
+        self._features.append(self.features(start, end))
+        self._timings.append(float(seconds))
+
+    def fit(self):
+        """
+        refits coefficients to recorded timings with non-negative least squares
+
+        only base and the coefficients whose features vary over the recorded moves are
+        fit, the others keep their current values. Fitted coefficients are pulled toward
+        their current values with weight prior_weight. Returns coefficients
+        """
+        if not self._timings:
+            return self.coefficients
+        features = np.array(self._features)
+        timings = np.array(self._timings)
+
+        fitted = np.ptp(features, axis=0) > 0
+        fitted[0] = True
+        # moves only exercising unfitted features still constrain the fitted ones
+        timings = timings - features[:, ~fitted].dot(self.coefficients[~fitted])
+
+        prior = self.coefficients[fitted]
+        weight = np.sqrt(self.prior_weight)
+        system = np.vstack([features[:, fitted], weight * np.eye(prior.size)])
+        target = np.concatenate([timings, weight * prior])
+        self.coefficients[fitted], _ = nnls(system, target)
+        return self.coefficients
+
+
+class SweepPlanner(object):
+    """
+    Orders sweep points to minimize total expected settling time under a SettlingModel.
+
+    Starts with a greedy nearest neighbour path and improves it with 2-opt moves.
+
+    Parameters
+    ----------
+    model : SettlingModel, optional
+        cost model used to order points
+
+    max_passes : int, optional
+        maximum number of 2-opt improvement passes
+    """
+    def __init__(self, model=None, max_passes=10):
+        self.model = model if model is not None else SettlingModel()
+        self.max_passes = max_passes
+
+    def plan(self, points, start=None):
+        """
+        returns list of indices into points in the order they should be visited
+
+        if start is given (the current instrument point) the path begins next to it,
+        otherwise the path begins at the lowest power point
+        """
+        count = len(points)
+        if count < 3:
+            return list(range(count))
+
+        cost = self.model.cost
+        if start is None:
+            first = min(range(count), key=lambda i: _as_point(points[i])[1])
+        else:
+            first = min(range(count), key=lambda i: cost(start, points[i]))
+
+        order = [first]
+        remaining = set(range(count))
+        remaining.remove(first)
+        while remaining:
+            last = points[order[-1]]
+            nearest = min(remaining, key=lambda i: cost(last, points[i]))
+            order.append(nearest)
+            remaining.remove(nearest)
+
+        return self._two_opt(points, order, start)
+
+    def _two_opt(self, points, order, start):
+        """
+        improves path by reversing segments while that lowers total cost
+        (SettlingModel costs are symmetric so a reversed segment keeps its inner cost)
+        """
+        cost = self.model.cost
+
+        def edge(i, j):
+            """ cost between order positions i and j, position -1 is start """
+            if i < 0:
+                return 0.0 if start is None else cost(start, points[order[j]])
+            return cost(points[order[i]], points[order[j]])
+
+        for _ in range(self.max_passes):
+            improved = False
+            for i in range(len(order) - 1):
+                for j in range(i + 1, len(order)):
+                    before = edge(i - 1, i)
+                    after = edge(i - 1, j)
+                    if j + 1 < len(order):
+                        before += edge(j, j + 1)
+                        after += edge(i, j + 1)
+                    if after < before - 1E-12:
+                        order[i:j + 1] = order[i:j + 1][::-1]
+                        improved = True
+            if not improved:
+                break
+        return order
+
+    def expected_time(self, points, order, start=None):
+        """ returns expected total settling time of visiting points in order """
+        path = [points[i] for i in order]
+        if start is not None:
+            path.insert(0, start)
+        return sum(self.model.cost(a, b) for a, b in zip(path[:-1], path[1:]))
+
+
+class SettleDetector(object):
+    """
+    Waits until an instrument setup has settled by taking fast repeated readings and
+    returning once successive readings agree within tolerance.
+
+    Parameters
+    ----------
+    probe : function()
+        returns a reading (e.g. measured power in dBm)
+
+    tolerance : float, optional
+        maximum difference between successive readings to count as settled
+
+    consecutive : int, optional
+        number of successive readings in a row that must agree
+
+    interval : float, optional
+        delay (s) between readings
+
+    max_wait : float, optional
+        maximum time (s) to wait before giving up and moving on
+    """
+    def __init__(self, probe, tolerance=0.05, consecutive=2, interval=0.0, max_wait=2.0):
+        self.probe = probe
+        self.tolerance = tolerance
+        self.consecutive = consecutive
+        self.interval = interval
+        self.max_wait = max_wait
+        self.last_reading = None
+
+    @classmethod
+    def from_analyzer(cls, analyzer, **kwargs):
+        """ returns SettleDetector which probes peak power of a spectrum analyzer """
+        def probe():
+            """ takes a sweep and returns peak power """
+            analyzer.take_sweep()
+            return analyzer.peak_power()
+        return cls(probe, **kwargs)
+
+    def wait(self):
+        """
+        takes readings until settled or max_wait is reached
+        returns (time (s) waited, True if readings converged before max_wait)
+        """
+        start = time()
+        previous = self.probe()
+        agreed = 0
+        while agreed < self.consecutive and time() - start < self.max_wait:
+            if self.interval > 0:
+                sleep(self.interval)
+            reading = self.probe()
+            if abs(reading - previous) <= self.tolerance:
+                agreed += 1
+            else:
+                agreed = 0
+            previous = reading
+        self.last_reading = previous
+        return time() - start, agreed >= self.consecutive
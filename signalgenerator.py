@@ -1,11 +1,14 @@
 """ contains signal generator classes """
 
 from __future__ import print_function
-from time import sleep
+import os
+from functools import partial
+from time import sleep, time
 import numpy as np
-from scipy.interpolate import interp1d
 
 from devices import BaseDevice
+from gaintable import GainTable
+from settling import SettlingModel, SweepPlanner
 
 DEFAULT_ADDRESS = ('131.243.201.231', 18)
 
@@ -35,7 +38,8 @@ class SignalGenerator(BaseDevice):
         maximum real power output that the signal generator is allowed to output.
 
     gain_file : str, optional
-        name of the gain file to use
+        name of the gain file to use, either a text gain file or a binary
+        frequency dependent gain table (see gaintable)
 
     Returns
     -------
@@ -44,13 +48,14 @@ class SignalGenerator(BaseDevice):
     def __init__(self, interface, min_output=None, max_output=None, gain_file=None):
         # initialize signal generator
         super(SignalGenerator, self).__init__(interface)
+        self.settle_times = None
+        self.settled = None
         self._gain_file = gain_file
+        self._frequency = None
         if self._gain_file is not None:
-            raws, gains = np.loadtxt(self._gain_file, unpack=True, usecols=[0, 1])
-            self._raw_to_real = interp1d(raws, raws + gains)
-            self._real_to_raw = interp1d(raws + gains, raws)
-            self.min_output = min_output if min_output is not None else self.raw_to_real(raws[0])
-            self.max_output = max_output if max_output is not None else self.raw_to_real(raws[-1])
+            self._gain_table = GainTable.load(self._gain_file)
+            self.min_output = min_output if min_output is not None else self._gain_table.min_real
+            self.max_output = max_output if max_output is not None else self._gain_table.max_real
         else:
             self.min_output = min_output if min_output is not None else -1E99
             self.max_output = max_output if max_output is not None else 1E99
@@ -58,12 +63,14 @@ class SignalGenerator(BaseDevice):
     @property
     def frequency(self):
         """ gets real signal frequency (currently alias as raw_frequency) """
-        return self.raw_frequency
+        self._frequency = self.raw_frequency
+        return self._frequency
 
     @frequency.setter
     def frequency(self, value):
         """ set real signal frequency (currently alias for raw_frequency) """
         self.raw_frequency = value
+        self._frequency = value
 
     @property
     def power(self):
@@ -77,57 +84,140 @@ class SignalGenerator(BaseDevice):
         new_power = self.real_to_raw(value)
         self.raw_power = new_power
 
-    def power_sweep(self, output_powers, callback, state=None, delay=0):
+    def power_sweep(self, output_powers, callback, state=None, delay=0, planner=None, settle=None):
         """
         sets the power to each power in out_powers in order calling callback with each set power
 
         Parameters
         ----------
         out_powers : iterable
-            the output powers to use
-        callback : function(power, state)
-            called on each set power with power and state as arguments
+            the output powers to use, or (frequency, power) pairs to sweep frequency too
+        callback : function(raw_power, point, state)
+            called on each set point with the raw power, the point (power or
+            (frequency, power) pair) and state as arguments
         state :
             passed to callback on each set power
+        planner : settling.SweepPlanner, optional
+            if given, points are visited in the order planned to minimize settling time.
+            When settle is given as well, measured settling times are recorded to the
+            planner's model and it is refit after the sweep
+        settle : settling.SettleDetector, optional
+            if given, waits until measured readings converge after each set instead of
+            sleeping for delay. Per-point settle times are stored in self.settle_times
+            and self.settled is False for points which hit max_wait without converging
+
+        Returns
+        -------
+        list of callback return values in the order of output_powers
         """
+        if planner is not None:
+            order = planner.plan(output_powers)
+        else:
+            order = range(len(output_powers))
+        results = [None] * len(output_powers)
+        self.settle_times = np.zeros(len(output_powers))
+        self.settled = np.ones(len(output_powers), dtype=bool)
+
         self.signal_on = False
-        self.power = output_powers[0]
+        self._set_point(output_powers[order[0]])
 
         try:
             self.signal_on = True
-            sleep(1)
-
-            for power in output_powers:
-                raw = self.real_to_raw(power)
-                self.power = power
-                sleep(delay)
-                callback(raw, power, state)
+            if settle is None:
+                sleep(1)
+            else:
+                settle.wait()
+
+            previous = output_powers[order[0]]
+            for index in order:
+                point = output_powers[index]
+                start = time()
+                raw = self._set_point(point)
+                if settle is None:
+                    sleep(delay)
+                    self.settle_times[index] = delay
+                else:
+                    self.settle_times[index], self.settled[index] = settle.wait()
+                    if planner is not None and self.settled[index]:
+                        planner.model.record(previous, point, time() - start)
+                previous = point
+                results[index] = callback(raw, point, state)
         except:
             self.signal_on = False
             raise
 
         self.signal_on = False
+        if planner is not None and settle is not None:
+            planner.model.fit()
+        return results
+
+    def _set_point(self, point):
+        """ sets a sweep point (power or (frequency, power) pair), returns raw power """
+        if isinstance(point, (tuple, list)):
+            freq, power = point
+            if freq != self._frequency:
+                self.frequency = freq
+        else:
+            power = point
+        raw = self.real_to_raw(power)
+        self.power = power
+        return raw
+
+    @staticmethod
+    def sweep_planner(power_breakpoints=(), ref_breakpoints=()):
+        """
+        returns a SweepPlanner using a settling model for a sweep
 
-    def raw_to_real(self, raw_power):
-        """ returns real output from raw output """
+        power_breakpoints are the powers where the signal generator switches attenuator range
+        and ref_breakpoints the powers where the measuring instrument changes reference level
+        """
+        model = SettlingModel(power_breakpoints=power_breakpoints,
+                              ref_breakpoints=ref_breakpoints)
+        return SweepPlanner(model)
+
+    def _gain_frequency(self, frequency):
+        """ returns frequency to correct gain at, defaults to the last known frequency """
+        if frequency is not None or not self._gain_table.frequency_dependent:
+            return frequency
+        if self._frequency is None:
+            return self.frequency
+        return self._frequency
+
+    def raw_to_real(self, raw_power, frequency=None):
+        """
+        returns real output from raw output
+        raw_power and frequency (Hz) may be arrays, frequency defaults to current frequency
+        """
         if self._gain_file is not None:
-            return float(self._raw_to_real(raw_power))
+            real = self._gain_table.raw_to_real(raw_power, self._gain_frequency(frequency))
+            return float(real) if real.ndim == 0 else real
         return raw_power
 
-    def real_to_raw(self, real_power):
-        """ returns raw power from real power """
+    def real_to_raw(self, real_power, frequency=None):
+        """
+        returns raw power from real power
+        real_power and frequency (Hz) may be arrays, frequency defaults to current frequency
+        """
         if self._gain_file is not None:
-            return float(self._real_to_raw(real_power))
+            raw = self._gain_table.real_to_raw(real_power, self._gain_frequency(frequency))
+            return float(raw) if raw.ndim == 0 else raw
         return real_power
 
-    def profile(self, filename, output_powers, get_real_power, runs=3):
-        """ get description from old file """
+    def profile(self, filename, output_powers, get_real_power, runs=3, results=None):
+        """
+        get description from old file
+
+        results : results.ResultsWriter, optional
+            if given, each gain is streamed to it as it is measured
+            (needs 'run', 'raw_power' and 'gain' fields)
+        """
         assert self._gain_file is None
-        gains = np.empty((runs, len(output_powers)), dtype=np.float)
+        gains = np.empty((runs, len(output_powers)), dtype=float)
         for i in range(runs):
             print("\nRun {0:d}:".format(i + 1))
             state = (get_real_power, gains[i], iter(range(gains[i].size)))
-            self.power_sweep(output_powers, self.profile_callback, state)
+            callback = partial(self.profile_callback, results=results, run=i)
+            self.power_sweep(output_powers, callback, state)
 
         means = gains.mean(axis=0)
         stds = gains.std(axis=0)
@@ -135,13 +225,128 @@ class SignalGenerator(BaseDevice):
             for vals in zip(output_powers, means, stds):
                 gainfile.write("{0:.2f} {1:.2f} {2:.2f}\n".format(*vals))
 
+    def adaptive_profile(self, filename, output_powers, get_real_power, target_sem=0.05,
+                         min_reads=3, max_reads=20, nonlinearity=0.1, min_step=0.25,
+                         checkpoint=None, settle=None, delay=0):
+        """
+        profiles gain like profile but only takes as many readings as needed
+
+        each point is read until the standard error of its gain is below target_sem
+        (between min_reads and max_reads readings). Points are added between the coarse
+        output_powers only where the gain curve bends by more than nonlinearity (dB)
+        from a straight line, down to intervals of min_step (dB).
+
+        Finished points are appended to checkpoint (defaults to filename + '.partial')
+        as they are measured. An interrupted profile resumes from the checkpoint when
+        called again with the same filename. The checkpoint is removed once the gain
+        file is written.
+
+        settle : settling.SettleDetector, optional
+            used to wait after each set power, otherwise sleeps for delay
+        """
+        assert self._gain_file is None
+        checkpoint = filename + '.partial' if checkpoint is None else checkpoint
+        points = self._load_checkpoint(checkpoint)
+
+        with open(checkpoint, 'a') as ckpt:
+            def measure(raw):
+                """ returns mean gain at raw, measuring and checkpointing it if needed """
+                key = round(raw, 6)
+                if key not in points:
+                    points[key] = self._measure_gain(raw, get_real_power, target_sem,
+                                                     min_reads, max_reads, settle, delay)
+                    ckpt.write("{0:.6f} {1:.6f} {2:.6f} {3:d}\n".format(key, *points[key]))
+                    ckpt.flush()
+                    os.fsync(ckpt.fileno())
+                return points[key][0]
+
+            raws = sorted(output_powers)
+            self.signal_on = False
+            self.power = raws[0]
+            try:
+                self.signal_on = True
+                if settle is None:
+                    sleep(1)
+                else:
+                    settle.wait()
+
+                for raw in raws:
+                    measure(raw)
+
+                refine = True
+                while refine:
+                    refine = False
+                    raws = sorted(points)
+                    gains = [points[raw][0] for raw in raws]
+                    curvature = _curvatures(raws, gains)
+                    for i in range(len(raws) - 1):
+                        width = raws[i + 1] - raws[i]
+                        bend = max(curvature[i], curvature[i + 1]) * width ** 2 / 4
+                        mid = round((raws[i] + raws[i + 1]) / 2, 2)
+                        if width >= 2 * min_step and bend > nonlinearity and mid not in points:
+                            measure(mid)
+                            refine = True
+            except:
+                self.signal_on = False
+                raise
+
+            self.signal_on = False
+
+        with open(filename, 'w+') as gainfile:
+            for raw in sorted(points):
+                mean, std, _ = points[raw]
+                gainfile.write("{0:.2f} {1:.2f} {2:.2f}\n".format(raw, mean, std))
+        os.remove(checkpoint)
+
+    def _measure_gain(self, raw_power, get_real_power, target_sem, min_reads, max_reads,
+                      settle, delay):
+        """ sets raw_power and reads gain until its standard error is below target_sem """
+        self.power = raw_power
+        if settle is None:
+            sleep(delay)
+        else:
+            settle.wait()
+
+        gains = []
+        while len(gains) < max_reads:
+            gains.append(get_real_power() - raw_power)
+            if len(gains) >= max(min_reads, 2):
+                sem = np.std(gains, ddof=1) / np.sqrt(len(gains))
+                if sem <= target_sem:
+                    break
+
+        print("Raw: {0:.2f}, Gain {1:.2f}, Reads {2:d}".format(raw_power, np.mean(gains),
+                                                              len(gains)))
+        return float(np.mean(gains)), float(np.std(gains)), len(gains)
+
     @staticmethod
-    def profile_callback(raw_power, real_power, state):
-        """ get description from old file """
+    def _load_checkpoint(checkpoint):
+        """ returns {raw: (mean, std, reads)} of points saved to checkpoint """
+        points = {}
+        if not os.path.exists(checkpoint):
+            return points
+        with open(checkpoint) as ckpt:
+            for line in ckpt:
+                vals = line.split()
+                # skip a line cut short by an interrupted write
+                if len(vals) != 4:
+                    continue
+                points[round(float(vals[0]), 6)] = (float(vals[1]), float(vals[2]), int(vals[3]))
+        return points
+
+    @staticmethod
+    def profile_callback(raw_power, real_power, state, results=None, run=0):
+        """
+        get description from old file
+
+        if results (a results.ResultsWriter) is given the gain is appended to it with run
+        """
         real_power = None
         get_real_power, gains, counter = state
         gain = get_real_power() - raw_power
         gains[next(counter)] = gain
+        if results is not None:
+            results.append(run=run, raw_power=raw_power, gain=gain)
         print("Raw: {0:.2f}, Gain {1:.2f}".format(raw_power, gain))
 
     @property
@@ -173,3 +378,20 @@ class SignalGenerator(BaseDevice):
     def signal_on(self, value):
         """ set signal on or off """
         raise NotImplementedError
+
+
+def _curvatures(raws, gains):
+    """
+    returns |second divided difference| of gains at each point
+    (end points take the value of their neighbour)
+    """
+    if len(raws) < 3:
+        return [0.0] * len(raws)
+    curvature = [0.0] * len(raws)
+    for i in range(1, len(raws) - 1):
+        left = (gains[i] - gains[i - 1]) / (raws[i] - raws[i - 1])
+        right = (gains[i + 1] - gains[i]) / (raws[i + 1] - raws[i])
+        curvature[i] = abs(right - left) / (raws[i + 1] - raws[i - 1])
+    curvature[0] = curvature[1]
+    curvature[-1] = curvature[-2]
+    return curvature
@@ -1,9 +1,35 @@
 """ provides general spectrum analyzer classes """
 from __future__ import print_function
-from devices import BaseDevice
+from collections import namedtuple
+from contextlib import contextmanager
+from math import log10, sqrt
+from devices import BaseDevice, DeviceError
+
+WindowSettings = namedtuple('WindowSettings', ['span', 'rbw', 'vbw', 'points', 'sweep_time'])
+
+def _steps_1_3(low, high):
+    """ returns 1, 3 sequence of values from low to high """
+    steps = []
+    decade = low
+    while decade <= high:
+        steps.extend(step for step in (decade, 3 * decade) if step <= high)
+        decade *= 10
+    return tuple(steps)
+
 
 class SpectrumAnalyzer(BaseDevice):
     """ generic spectrum analyzer class """
+    # allowed resolution bandwidths (Hz), largest video bandwidth (Hz) and sweep points
+    RBW_STEPS = ()
+    MAX_VBW = None
+    SWEEP_POINTS = ()
+    # swept sweep time is SWEEP_TIME_FACTOR * span / rbw**2 but at least MIN_SWEEP_TIME (s)
+    # SWEEP_TIME_FACTOR can be fit to the instrument with calibrate_sweep_time
+    SWEEP_TIME_FACTOR = 2.5
+    MIN_SWEEP_TIME = None
+
+    _zero_span_freq = None
+    _zero_span_settings = None
 
     @property
     def center_frequency(self):
@@ -54,6 +80,170 @@ class SpectrumAnalyzer(BaseDevice):
         if ref_lvl is not None:
             self.reference_level = ref_lvl
 
+    @contextmanager
+    def fast_mode(self, points=None):
+        """
+        context for fast automated measurements
+
+        snapshots the current settings, switches to the fastest safe acquisition
+        configuration (display updates off, single sweep and, only if points is given, the
+        fewest sweep points that give at least points; otherwise the current point count,
+        e.g. one chosen by optimize_window, is kept) and restores the snapshot in one write
+        on exit.
+        Use take_sweep to sweep while in fast mode.
+        Alignment is left alone: the FSP only aligns when asked (CAL?) and the HP8593E
+        driver exposes no alignment setting.
+        """
+        snapshot = self._fast_mode_snapshot()
+        try:
+            self._fast_mode_enter(points)
+            yield self
+        finally:
+            self._fast_mode_restore(snapshot)
+
+    def _fast_mode_snapshot(self):
+        """ returns settings changed by fast mode """
+        raise NotImplementedError
+
+    def _fast_mode_enter(self, points):
+        """ switches to fast acquisition settings """
+        raise NotImplementedError
+
+    def _fast_mode_restore(self, snapshot):
+        """ restores settings from snapshot with a single write """
+        raise NotImplementedError
+
+    @property
+    def sweep_time(self):
+        """ get sweep time (s) """
+        raise NotImplementedError
+
+    @property
+    def resolution_bandwidth(self):
+        """ get resolution bandwidth (Hz) """
+        raise NotImplementedError
+
+    def model_sweep_time(self, span, rbw):
+        """ returns modeled sweep time (s) for span and rbw (Hz) with vbw >= rbw """
+        return max(self.SWEEP_TIME_FACTOR * span / rbw ** 2, self.MIN_SWEEP_TIME)
+
+    def calibrate_sweep_time(self):
+        """
+        fits SWEEP_TIME_FACTOR of this instrument to the sweep time it reports for its
+        current span and rbw (use auto coupled sweep time), returns the factor
+        """
+        span, rbw, sweep_time = self.span, self.resolution_bandwidth, self.sweep_time
+        # at the minimum sweep time the factor can't be seen
+        if span > 0 and sweep_time > 1.01 * self.MIN_SWEEP_TIME:
+            self.SWEEP_TIME_FACTOR = sweep_time * rbw ** 2 / span
+        return self.SWEEP_TIME_FACTOR
+
+    def optimize_window(self, freq, min_span, freq_uncertainty, amplitude_accuracy,
+                        ref_lvl=None, apply=True):
+        """
+        picks span, rbw, vbw and sweep points for a peak measurement with the shortest sweep
+
+        min_span (Hz) is the search range around freq which must contain the carrier.
+        The marker frequency step (span / (points - 1)) must be at most freq_uncertainty (Hz)
+        and the amplitude lost when the peak falls between two points must be at most
+        amplitude_accuracy (dB), which for the gaussian rbw filter means
+        rbw >= step * sqrt(3.01 / amplitude_accuracy). The span is at least min_span
+        and at least rbw. vbw is set to 3 * rbw (at most MAX_VBW) so it doesn't slow the sweep.
+
+        If apply, the window is set in a single command and sweep_time is the one
+        reported by the instrument, otherwise it is modeled.
+        Returns WindowSettings. Raises ValueError if no settings meet the requirements.
+        """
+        rbw_factor = sqrt(3.01 / amplitude_accuracy)
+        best = None
+        for points in self.SWEEP_POINTS:
+            for rbw in self.RBW_STEPS:
+                span = max(min_span, rbw)
+                if span > min(freq_uncertainty, rbw / rbw_factor) * (points - 1):
+                    continue
+                settings = WindowSettings(span, rbw, min(3 * rbw, self.MAX_VBW), points,
+                                          self.model_sweep_time(span, rbw))
+                if best is None or (settings.sweep_time, points) < (best.sweep_time, best.points):
+                    best = settings
+        if best is None:
+            raise ValueError("no window gives {0} Hz and {1} dB accuracy over {2} Hz".format(
+                freq_uncertainty, amplitude_accuracy, min_span))
+
+        if apply:
+            self.sync_cmd(self._window_command(freq, best, ref_lvl))
+            best = best._replace(sweep_time=self.sweep_time)
+        return best
+
+    def _window_command(self, freq, settings, ref_lvl):
+        """ returns single command setting center freq (Hz), WindowSettings and ref lvl """
+        raise NotImplementedError
+
+    def zero_span(self, freq, rbw=None, sweep_time=None):
+        """
+        tunes once to freq (Hz) in zero span for fast time domain power readings
+        the span, rbw, sweep time (and detector on the FSP) from before are restored
+        by exit_zero_span (expects single sweep mode, e.g. inside fast_mode)
+        """
+        if self._zero_span_freq is None:
+            self._zero_span_settings = (self._zero_span_snapshot(), rbw, sweep_time)
+        self.sync_cmd(self._zero_span_command(freq, rbw, sweep_time))
+        self._zero_span_freq = freq
+
+    def exit_zero_span(self):
+        """ leaves zero span and restores the settings from before zero_span """
+        if self._zero_span_freq is None:
+            return
+        snapshot, _, _ = self._zero_span_settings
+        self.sync_cmd(self._zero_span_exit_command(self._zero_span_freq, snapshot))
+        self._zero_span_freq = None
+
+    def zero_span_power(self, averages=1):
+        """ returns power (dBm) averaged (in mW) over the traces of averages zero span sweeps """
+        if self._zero_span_freq is None:
+            raise ValueError("not in zero span, call zero_span first")
+        total = sum(10 ** (self._zero_span_read() / 10) for _ in range(averages))
+        return 10 * log10(total / averages)
+
+    def tracked_peak(self, expected, drift_db=3.0, averages=1):
+        """
+        get_peak compatible power (dBm) read in zero span
+
+        expected is the power (dBm) the analyzer should read, e.g. a power_sweep callback
+        passes the commanded real power of the point (less any known losses), so deliberate
+        level changes aren't taken for drift. If the reading is more than drift_db below
+        expected the carrier is assumed to have drifted out of the rbw. The span is then
+        restored, a full sweep get_peak is taken and zero span is retuned to the peak.
+        """
+        power = self.zero_span_power(averages)
+        if power >= expected - drift_db:
+            return power
+
+        settings = self._zero_span_settings
+        _, rbw, sweep_time = settings
+        self.exit_zero_span()
+        self.take_sweep()
+        power = self.get_peak()
+        self.zero_span(self.peak_frequency(), rbw, sweep_time)
+        # keep the settings from before the first zero_span (get_peak may have zoomed)
+        self._zero_span_settings = settings
+        return power
+
+    def _zero_span_command(self, freq, rbw, sweep_time):
+        """ returns single command which sets up zero span power readings at freq (Hz) """
+        raise NotImplementedError
+
+    def _zero_span_snapshot(self):
+        """ returns settings changed by zero_span """
+        raise NotImplementedError
+
+    def _zero_span_exit_command(self, freq, snapshot):
+        """ returns single command which leaves zero span restoring snapshot around freq """
+        raise NotImplementedError
+
+    def _zero_span_read(self):
+        """ takes a zero span sweep and returns mean trace power (dBm) """
+        raise NotImplementedError
+
     def take_sweep(self):
         """ takes single sweep """
         raise NotImplementedError
@@ -88,6 +278,11 @@ class RandSFSP(SpectrumAnalyzer):
     -------
     RandSFSP spectrum analyzer object
     """
+    RBW_STEPS = _steps_1_3(10.0, 10E6)
+    MAX_VBW = 10E6
+    SWEEP_POINTS = (125, 251, 501, 1001, 2001, 4001, 8001)
+    MIN_SWEEP_TIME = 2.5E-3
+
     def __init__(self, interface):
         super(RandSFSP, self).__init__(interface)
         self.read_termination = '\n'
@@ -134,6 +329,56 @@ class RandSFSP(SpectrumAnalyzer):
         arg = "ON" if value else "OFF"
         self.sync_cmd("*WAI;INIT:CONT " + arg)
 
+    @property
+    def sweep_time(self):
+        """ get sweep time (s) """
+        return float(self.query("SWE:TIME?"))
+
+    @property
+    def resolution_bandwidth(self):
+        """ get resolution bandwidth (Hz) """
+        return float(self.query("BAND?"))
+
+    def _window_command(self, freq, settings, ref_lvl):
+        """ returns single command setting center freq (Hz), WindowSettings and ref lvl """
+        cmd = "FREQ:CENT {0:.2f}Hz;FREQ:SPAN {1:.2f}Hz;BAND {2:.2f}Hz;BAND:VID {3:.2f}Hz;" \
+              "SWE:POIN {4:d}".format(freq, settings.span, settings.rbw, settings.vbw,
+                                      settings.points)
+        if ref_lvl is not None:
+            cmd += ";DISP:WIND:TRAC:Y:RLEV {0:.2f}dBm".format(ref_lvl)
+        return cmd
+
+    def _zero_span_command(self, freq, rbw, sweep_time):
+        """ zero span with rms detector and the mean summary marker """
+        cmd = "FREQ:CENT {0:.2f}Hz;FREQ:SPAN 0Hz".format(freq)
+        if rbw is not None:
+            cmd += ";BAND {0:.2f}Hz".format(rbw)
+        if sweep_time is not None:
+            cmd += ";SWE:TIME {0:g}s".format(sweep_time)
+        return cmd + ";DET RMS;CALC:MARK ON;CALC:MARK:FUNC:SUMM:STAT ON;" \
+                     "CALC:MARK:FUNC:SUMM:MEAN ON"
+
+    def _zero_span_snapshot(self):
+        """ returns (span, rbw, rbw auto, sweep time, sweep time auto, detector, detector auto) """
+        span, rbw, rbw_auto, sweep_time, sweep_time_auto, det, det_auto = self.query(
+            "FREQ:SPAN?;BAND?;BAND:AUTO?;SWE:TIME?;SWE:TIME:AUTO?;DET?;DET:AUTO?").split(';')
+        return (float(span), float(rbw), bool(int(rbw_auto)), float(sweep_time),
+                bool(int(sweep_time_auto)), det.strip(), bool(int(det_auto)))
+
+    def _zero_span_exit_command(self, freq, snapshot):
+        """ summary marker off and span, rbw, sweep time and detector restored """
+        span, rbw, rbw_auto, sweep_time, sweep_time_auto, det, det_auto = snapshot
+        cmd = "CALC:MARK:FUNC:SUMM:STAT OFF;FREQ:CENT {0:.2f}Hz;FREQ:SPAN {1:.2f}Hz".format(
+            freq, span)
+        cmd += ";BAND:AUTO ON" if rbw_auto else ";BAND {0:.2f}Hz".format(rbw)
+        cmd += ";SWE:TIME:AUTO ON" if sweep_time_auto else ";SWE:TIME {0:g}s".format(sweep_time)
+        cmd += ";DET:AUTO ON" if det_auto else ";DET " + det
+        return cmd
+
+    def _zero_span_read(self):
+        """ takes a zero span sweep and returns mean trace power (dBm) """
+        return float(self.query("INIT;*WAI;CALC:MARK:FUNC:SUMM:MEAN:RES?"))
+
     def take_sweep(self):
         """ takes a single sweep and waits for completion """
         self.sync_cmd("INIT")
@@ -158,21 +403,37 @@ class RandSFSP(SpectrumAnalyzer):
         arg = "ON" if disp_on else "OFF"
         self.write("SYST:DISP:UPD " + arg + ";*WAI")
 
+    def _fast_mode_snapshot(self):
+        """ returns (continuous sweep, display update, sweep points) """
+        cont, disp, points = self.query("INIT:CONT?;SYST:DISP:UPD?;SWE:POIN?").split(';')
+        return bool(int(cont)), bool(int(disp)), int(float(points))
+
+    def _fast_mode_enter(self, points):
+        """ single sweep, display updates off and fewest sweep points giving points if given """
+        cmd = "INIT:CONT OFF;SYST:DISP:UPD OFF"
+        if points is not None:
+            points = min([pts for pts in self.SWEEP_POINTS if pts >= points]
+                         or [self.SWEEP_POINTS[-1]])
+            cmd += ";SWE:POIN {:d}".format(points)
+        self.sync_cmd(cmd)
+
+    def _fast_mode_restore(self, snapshot):
+        """ restores continuous sweep, display update and sweep points """
+        cont, disp, points = snapshot
+        self.write("INIT:CONT {0};SYST:DISP:UPD {1};SWE:POIN {2:d};*WAI".format(
+            "ON" if cont else "OFF", "ON" if disp else "OFF", points))
+
     def auto_ref_lvl(self):
         """ sets ref lvl to optimal value """
         self.sync_cmd("SENS:POW:ACH:PRES:RLEV")
 
     def sync_cmd(self, cmd):
-        """ queries operation complete after sending command """
-        assert int(self.query(cmd + ";*OPC?")) == 1
-
-    def syst_err(self):
-        """ queries system err queue and returns result """
-        err = self.query("SYST:ERR?")
-        err = err.split(',')
-        err_code = int(err[0])
-        err_msg = str(err[1]).strip('"')
-        return err_code, err_msg
+        """
+        queries operation complete after sending command
+        raises DeviceError with the error queue if the command didn't complete
+        """
+        if int(self.query(cmd + ";*OPC?")) != 1:
+            raise DeviceError(self.error_queue(), [cmd])
 
     def rst(self):
         """ resets system """
@@ -184,6 +445,10 @@ class HP8593E(SpectrumAnalyzer):
     class for HP8593E spectrum analyzer
     WARNING: doesn't work with prologix enet controller
     """
+    RBW_STEPS = _steps_1_3(1E3, 3E6)
+    MAX_VBW = 3E6
+    SWEEP_POINTS = (401,)
+    MIN_SWEEP_TIME = 0.02
 
     @property
     def center_frequency(self):
@@ -237,6 +502,50 @@ class HP8593E(SpectrumAnalyzer):
         if ref_lvl is not None:
             self.reference_level = ref_lvl
 
+    @property
+    def sweep_time(self):
+        """ get sweep time (s) """
+        return float(self.query('ST?'))
+
+    @property
+    def resolution_bandwidth(self):
+        """ get resolution bandwidth (Hz) """
+        return float(self.query('RB?'))
+
+    def _window_command(self, freq, settings, ref_lvl):
+        """ returns single command setting center freq (Hz), WindowSettings and ref lvl """
+        cmd = 'CF {0:f} HZ;SP {1:f} HZ;RB {2:f} HZ;VB {3:f} HZ'.format(
+            freq, settings.span, settings.rbw, settings.vbw)
+        if ref_lvl is not None:
+            cmd += ';RL {:f} DB'.format(ref_lvl)
+        return cmd
+
+    def _zero_span_command(self, freq, rbw, sweep_time):
+        """ zero span at freq (Hz) """
+        cmd = 'CF {0:f} HZ;SP 0 HZ'.format(freq)
+        if rbw is not None:
+            cmd += ';RB {0:f} HZ'.format(rbw)
+        if sweep_time is not None:
+            cmd += ';ST {0:f} SC'.format(sweep_time)
+        return cmd
+
+    def _zero_span_snapshot(self):
+        """
+        returns (span, rbw, sweep time)
+        restoring sets them explicitly so auto coupling is left off
+        """
+        return self.span, self.resolution_bandwidth, self.sweep_time
+
+    def _zero_span_exit_command(self, freq, snapshot):
+        """ restores span and rbw (Hz) centered at freq (Hz) and sweep time (s) """
+        span, rbw, sweep_time = snapshot
+        return 'CF {0:f} HZ;SP {1:f} HZ;RB {2:f} HZ;ST {3:f} SC'.format(freq, span, rbw,
+                                                                         sweep_time)
+
+    def _zero_span_read(self):
+        """ takes a zero span sweep and returns mean trace power (dBm) """
+        return float(self.query('TS;MEAN TRA?'))
+
     def take_sweep(self):
         """ takes single sweep """
         # TODO: sync
@@ -251,8 +560,24 @@ class HP8593E(SpectrumAnalyzer):
         return float(self.query('MKF?'))
 
     def sync_cmd(self, cmd):
-        """ queries operation complete after sending command """
-        assert int(self.query(cmd + ";*OPC?")) == 1
+        """
+        queries operation complete after sending command
+        raises DeviceError if the command didn't complete (no SCPI error queue to drain)
+        """
+        if int(self.query(cmd + ";*OPC?")) != 1:
+            raise DeviceError([], [cmd])
+
+    def _fast_mode_snapshot(self):
+        """ returns continuous sweep (sweep points are fixed at 401) """
+        return self.continuous_sweep
+
+    def _fast_mode_enter(self, points):
+        """ single sweep """
+        self.continuous_sweep = False
+
+    def _fast_mode_restore(self, snapshot):
+        """ restores continuous sweep """
+        self.continuous_sweep = snapshot
 
     def peak_zoom(self):
         """ zoom to peak """
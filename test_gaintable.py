@@ -0,0 +1,76 @@
+""" tests converting text gain files to memory mapped gain tables """
+import numpy as np
+import pytest
+from scipy.interpolate import interp1d
+
+from gaintable import GainTable, convert_text
+
+RAWS = np.arange(-30.0, 10.5, 2.5)
+
+
+def write_gain_file(filename, raws, gains):
+    """ writes a text gain file in the format profile writes """
+    with open(filename, 'w') as gainfile:
+        for raw, gain in zip(raws, gains):
+            gainfile.write("{0:.2f} {1:.4f} 0.01\n".format(raw, gain))
+
+
+@pytest.fixture
+def gain_files(tmpdir):
+    """ an ascending and a descending (high to low power sweep) gain file """
+    low_gains = -3.0 - 0.02 * RAWS - 0.001 * RAWS ** 2
+    high_gains = -4.0 - 0.03 * RAWS
+    low = str(tmpdir.join('low.txt'))
+    high = str(tmpdir.join('high.txt'))
+    write_gain_file(low, RAWS, low_gains)
+    write_gain_file(high, RAWS[::-1], high_gains[::-1])
+    return [(low, 1E9, low_gains), (high, 2E9, high_gains)]
+
+
+def test_round_trip_matches_interp1d(gain_files, tmpdir):
+    files, freqs, _ = zip(*gain_files)
+    table_file = str(tmpdir.join('table.bin'))
+    convert_text(list(files), table_file, list(freqs))
+    table = GainTable.load(table_file)
+    # memory mapped read only
+    assert not table.gains.flags.writeable
+
+    raws = np.linspace(-29.0, 9.0, 17)
+    for filename, freq, _ in gain_files:
+        file_raws, file_gains = np.loadtxt(filename, unpack=True, usecols=[0, 1])
+        to_real = interp1d(file_raws, file_raws + file_gains)
+        to_raw = interp1d(file_raws + file_gains, file_raws)
+        reals = table.raw_to_real(raws, freq)
+        assert np.allclose(reals, to_real(raws))
+        assert np.allclose(table.real_to_raw(reals, freq), to_raw(reals))
+
+
+def test_descending_text_file(gain_files):
+    filename, _, gains = gain_files[1]
+    table = GainTable.load(filename)
+    assert not table.frequency_dependent
+    assert np.all(np.diff(table.raws) > 0)
+    assert table.min_real == pytest.approx(RAWS[0] + gains[0])
+    assert table.max_real == pytest.approx(RAWS[-1] + gains[-1])
+    real = table.raw_to_real(-5.3)
+    assert table.real_to_raw(real) == pytest.approx(-5.3)
+
+
+def test_interpolates_between_frequencies(gain_files):
+    files, freqs, gains = zip(*gain_files)
+    table = GainTable.from_text(list(files), list(freqs))
+    middle = table.raw_to_real(RAWS, 1.5E9)
+    assert np.allclose(middle, RAWS + (gains[0] + gains[1]) / 2, atol=1E-4)
+
+
+def test_rejects_unsorted_axes():
+    with pytest.raises(ValueError):
+        GainTable([2E9, 1E9], RAWS, np.zeros((2, RAWS.size)))
+    with pytest.raises(ValueError):
+        GainTable([1E9], RAWS[::-1], np.zeros((1, RAWS.size)))
+
+
+def test_out_of_range(gain_files):
+    table = GainTable.load(gain_files[0][0])
+    with pytest.raises(ValueError):
+        table.raw_to_real(RAWS[-1] + 1)
@@ -0,0 +1,86 @@
+""" tests ScpiSocketInterface against a local TCP stand-in instrument """
+import socket
+import threading
+
+import pytest
+
+from interfaces import ScpiSocketInterface, InterfaceTimeoutError
+
+DATA = bytes(bytearray(range(256))) * 8
+
+
+class StandIn(object):
+    """ local TCP server answering each received line from a dict of replies """
+    def __init__(self, replies):
+        self.replies = replies
+        self.received = []
+        self._server = socket.socket()
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+        thread = threading.Thread(target=self._serve)
+        thread.daemon = True
+        thread.start()
+
+    def _serve(self):
+        conn, _ = self._server.accept()
+        for line in conn.makefile('rb'):
+            line = line.strip()
+            self.received.append(line)
+            reply = self.replies.get(line)
+            # send in small pieces to exercise reassembly
+            for start in range(0, len(reply or b''), 100):
+                conn.sendall(reply[start:start + 100])
+        conn.close()
+
+    def close(self):
+        self._server.close()
+
+
+@pytest.fixture
+def instrument():
+    stand_in = StandIn({
+        b'*IDN?': b'Rohde&Schwarz,FSP-7,1;2#3\n',
+        b'*OPC?': b'1\n',
+        b'TRAC? TRACE1': b'#4' + str(len(DATA)).encode('ascii') + DATA + b'\n',
+        b'TRAC? TRACE2': b'1.5,#3' + b'%03d' % 5 + b'a\nb\nc\n',
+    })
+    interface = ScpiSocketInterface('127.0.0.1', stand_in.port, timeout=2000)
+    yield stand_in, interface
+    interface.close()
+    stand_in.close()
+
+
+def test_reads_text_with_hash(instrument):
+    _, interface = instrument
+    interface.write_raw(b'*IDN?\n')
+    assert interface.read_raw() == b'Rohde&Schwarz,FSP-7,1;2#3\n'
+
+
+def test_reads_whole_binary_block(instrument):
+    _, interface = instrument
+    interface.write_raw(b'TRAC? TRACE1\n')
+    reply = interface.read_raw()
+    assert reply[6:-1] == DATA
+    assert reply.endswith(b'\n')
+
+
+def test_reads_block_after_separator(instrument):
+    _, interface = instrument
+    interface.write_raw(b'TRAC? TRACE2\n')
+    assert interface.read_raw() == b'1.5,#3005a\nb\nc\n'
+
+
+def test_queued_messages_and_wait_complete(instrument):
+    stand_in, interface = instrument
+    interface.write_raw(b'*IDN?\n*IDN?\n')
+    assert interface.read_raw() == interface.read_raw()
+    interface.wait_complete()
+    assert stand_in.received[-1] == b'*OPC?'
+
+
+def test_read_timeout(instrument):
+    _, interface = instrument
+    interface.timeout = 100
+    with pytest.raises(InterfaceTimeoutError):
+        interface.read_raw()
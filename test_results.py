@@ -0,0 +1,75 @@
+""" tests ResultsWriter resuming, schema checks and read_results """
+import os
+
+import numpy as np
+import pytest
+
+from results import ResultsWriter, read_results
+
+FIELDS = [('raw', '<f8'), ('real', '<f4'), ('run', '<i2')]
+
+
+def write_rows(path, count, **kwargs):
+    """ writes count rows with raw = real = run = row number """
+    with ResultsWriter(path, FIELDS, **kwargs) as writer:
+        for i in range(count):
+            writer.append(timestamp=float(i), raw=i, real=i, run=i)
+
+
+def test_round_trip(tmpdir):
+    path = str(tmpdir.join('results'))
+    write_rows(path, 10, settings={'rbw': 1E3}, chunk_size=4)
+    schema, columns = read_results(path)
+    assert schema['settings'] == {'rbw': 1E3}
+    assert sorted(columns) == ['raw', 'real', 'run', 'timestamp']
+    for name in columns:
+        assert np.array_equal(columns[name], np.arange(10))
+
+
+def test_read_partial_chunk(tmpdir):
+    path = str(tmpdir.join('results'))
+    write_rows(path, 10)
+    # a crash part way through a chunk leaves columns of different lengths
+    with open(os.path.join(path, 'raw.bin'), 'ab') as column:
+        column.write(np.arange(10, 14, dtype='<f8').tobytes())
+    with open(os.path.join(path, 'real.bin'), 'ab') as column:
+        column.write(b'\x00\x00')
+    _, columns = read_results(path)
+    for name in columns:
+        assert np.array_equal(columns[name], np.arange(10))
+
+
+def test_resume_truncates_to_complete_rows(tmpdir):
+    path = str(tmpdir.join('results'))
+    write_rows(path, 6)
+    with open(os.path.join(path, 'raw.bin'), 'ab') as column:
+        column.write(np.arange(6, 9, dtype='<f8').tobytes())
+    with open(os.path.join(path, 'run.bin'), 'ab') as column:
+        column.write(b'\x07')
+
+    with ResultsWriter(path, FIELDS) as writer:
+        for i in range(6, 9):
+            writer.append(timestamp=float(i), raw=i, real=i, run=i)
+    _, columns = read_results(path)
+    for name in columns:
+        assert np.array_equal(columns[name], np.arange(9))
+        assert os.path.getsize(os.path.join(path, name + '.bin')) == 9 * columns[name].itemsize
+
+
+def test_rejects_different_fields(tmpdir):
+    path = str(tmpdir.join('results'))
+    write_rows(path, 2)
+    with pytest.raises(ValueError):
+        ResultsWriter(path, [('raw', '<f8'), ('real', '<f8'), ('run', '<i2')])
+    with pytest.raises(ValueError):
+        ResultsWriter(path, FIELDS[:2])
+
+
+def test_closed_writer(tmpdir):
+    writer = ResultsWriter(str(tmpdir.join('results')), FIELDS)
+    writer.close()
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.append(raw=0, real=0, run=0)
+    with pytest.raises(ValueError):
+        writer.flush()